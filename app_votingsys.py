@@ -1,11 +1,25 @@
-import psycopg2, psycopg2.extras, os, json, traceback
-from flask import Flask, jsonify, request, render_template, session, redirect, url_for, flash, send_from_directory, make_response
+import psycopg2, psycopg2.extras, psycopg2.pool, os, json, traceback, atexit, threading, queue, time, sys
+from concurrent.futures import Future
+from collections import OrderedDict
+from itertools import groupby
+from operator import itemgetter
+from flask import Flask, jsonify, request, render_template, session, redirect, url_for, flash, send_from_directory, make_response, g
 from datetime import datetime 
 import pytz
 from language_data import languages
 import base64, io, numpy as np
 from PIL import Image
 #from deepface import DeepFace
+# Optional SIMD decoders for face verification; stdlib base64 / PIL are the fallback.
+try:
+    import pybase64 as b64
+except ImportError:
+    b64 = base64
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    TJ = TurboJPEG()
+except (ImportError, RuntimeError, OSError):  # package or libturbojpeg missing
+    TJ = None
 from dotenv import load_dotenv
 # --- MODIFIED IMPORTS for SHA-256 ---
 # Removed: from werkzeug.security import generate_password_hash, check_password_hash
@@ -79,20 +93,127 @@ IST = pytz.timezone('Asia/Kolkata')
 UTC = pytz.utc
 
 # --- DB helper ---
+# One pool per process. It is created lazily on first use so that a pre-forking
+# WSGI server never shares pooled sockets between workers.
+# psycopg2 closes a returned connection once minconn are already idle, so
+# minconn must cover the worker's thread count or connections churn. It
+# defaults to GUNICORN_THREADS (see gunicorn.conf.py).
+POOL = None
+_POOL_LOCK = threading.Lock()
+
+# Hot statements are prepared once per pooled connection (on first use) so
+# PostgreSQL can reuse their plans; run them with execute_prepared().
+# Prepared statements outlive schema changes: after a migration that changes a
+# prepared statement's result type (migrations/004) the app must be restarted,
+# or EXECUTE fails with "cached plan must not change result type".
+PREPARED_STATEMENTS = {
+    "voting_schedule": "SELECT start_time, end_time FROM voting_schedule WHERE society_name=$1",
+    "society_housing_type": "SELECT housing_type FROM settings WHERE society_name=$1",
+    "ballot_settings": "SELECT max_candidates_selection,is_towerwise FROM settings WHERE society_name=$1",
+    "claim_vote": """UPDATE households SET voted_in_cycle=$1, voted_at=$2
+                     WHERE id=$3 AND voted_in_cycle IS DISTINCT FROM $1
+                     RETURNING tower""",
+    "tally_vote": """WITH cfg AS (
+                         SELECT 1 FROM settings WHERE society_name=$1 AND max_voters IS NOT NULL AND voted_count IS NOT NULL
+                     ),
+                     s AS (
+                         UPDATE settings SET voted_count=voted_count+1
+                         WHERE society_name=$1 AND voted_count<max_voters
+                         RETURNING voted_count
+                     ),
+                     v AS (
+                         INSERT INTO votes (society_name,tower,contestant_name,is_archived,vote_count)
+                         SELECT $1::text,$2::text,c,0,1 FROM (SELECT DISTINCT unnest($3::text[]) AS c) sel
+                         WHERE EXISTS (SELECT 1 FROM s)
+                         ON CONFLICT (society_name,tower,contestant_name,is_archived)
+                         DO UPDATE SET vote_count=votes.vote_count+1
+                     )
+                     SELECT EXISTS (SELECT 1 FROM cfg) AS has_settings, (SELECT voted_count FROM s) AS voted_count""",
+}
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which PREPARED_STATEMENTS exist on it."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+def execute_prepared(cur, name, params):
+    """
+    Runs PREPARED_STATEMENTS[name] on cur, preparing it on this connection first
+    if needed. Preparing lazily means a statement that cannot be prepared (e.g. a
+    missing table) only fails the route that uses it.
+    """
+    conn = cur.connection
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+        conn.prepared.add(name)  # PREPARE is not transactional: it survives a later rollback
+    cur.execute(f"EXECUTE {name}({','.join(['%s'] * len(params))})", params)
+
+def get_pool():
+    """Returns the process-wide ThreadedConnectionPool, creating it on first call."""
+    global POOL
+    if POOL is None:
+        with _POOL_LOCK:
+            if POOL is None:
+                POOL = psycopg2.pool.ThreadedConnectionPool(
+                    minconn=int(os.getenv("DB_POOL_MIN", os.getenv("GUNICORN_THREADS", 2))),
+                    maxconn=int(os.getenv("DB_POOL_MAX", 32)),
+                    dbname=os.getenv("DB_NAME"),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    host=os.getenv("DB_HOST"),
+                    port=os.getenv("DB_PORT"),
+                    connection_factory=PooledConnection
+                )
+    return POOL
+
 def get_db():
-    """Establishes a connection to the PostgreSQL database using .env credentials."""
+    """
+    Checks a PostgreSQL connection out of the pool for the current request.
+    The connection is kept on flask.g so nested helpers reuse it, and is
+    handed back to the pool by put_db / the appcontext teardown.
+    """
+    conn = g.get('db_conn')
+    if conn is not None:
+        return conn
     try:
-        conn = psycopg2.connect( 
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT")
-        )
+        conn = get_pool().getconn()
+        conn.autocommit = False
+        g.db_conn = conn
         return conn
-    except psycopg2.OperationalError as e:
+    except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
         app.logger.error(f"Error connecting to PostgreSQL database: {e}")
         return None
+
+def put_db(conn):
+    """Resets session state on a connection and returns it to the pool."""
+    if conn is None:
+        return
+    if g.get('db_conn') is conn:
+        g.pop('db_conn')
+    try:
+        conn.rollback()
+        # DISCARD ALL minus DEALLOCATE ALL / DISCARD PLANS, so prepared statements
+        # survive. Autocommit keeps it to one round trip (no BEGIN/COMMIT).
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("CLOSE ALL; RESET ALL; UNLISTEN *; SELECT pg_advisory_unlock_all(); DISCARD TEMP; DISCARD SEQUENCES")
+        conn.autocommit = False
+        POOL.putconn(conn)
+    except psycopg2.Error as e:
+        # Broken connection: drop it instead of recycling it.
+        app.logger.error(f"Discarding pooled connection: {e}")
+        POOL.putconn(conn, close=True)
+
+@app.teardown_appcontext
+def release_db(exc):
+    """Safety net: returns a connection a route forgot to release."""
+    put_db(g.pop('db_conn', None))
+
+@atexit.register
+def close_pool():
+    if POOL is not None:
+        POOL.closeall()
     
 # --- Utility: numeric sort ---
 def numeric_sort(arr):
@@ -101,6 +222,43 @@ def numeric_sort(arr):
         return int(s) if s else 0
     return sorted(arr, key=parse_num)
 
+# --- Voting schedule cache ---
+# The schedule rarely changes during an election, so each process keeps the
+# parsed window for SCHEDULE_CACHE_TTL seconds instead of re-reading it per request.
+# The society name comes from unauthenticated requests, so only societies with a
+# voting_schedule row are cached and the cache is an LRU capped at SCHEDULE_CACHE_MAX.
+SCHEDULE_CACHE_TTL = float(os.getenv("SCHEDULE_CACHE_TTL", 30))
+SCHEDULE_CACHE_MAX = int(os.getenv("SCHEDULE_CACHE_MAX", 256))
+SCHED_CACHE = OrderedDict()  # society_name -> ((start_time, end_time) or None, expires_at)
+_SCHED_CACHE_LOCK = threading.Lock()
+
+def get_voting_schedule(cur, society):
+    """
+    Returns the society's voting window as (start_time, end_time) aware datetimes
+    (the columns are timestamptz, see migrations/004), or None when no schedule is set.
+    """
+    now = time.monotonic()
+    with _SCHED_CACHE_LOCK:
+        cached = SCHED_CACHE.get(society)
+        if cached and cached[1] > now:
+            SCHED_CACHE.move_to_end(society)
+            return cached[0]
+
+    execute_prepared(cur, "voting_schedule", (society,))
+    sched = cur.fetchone()
+    if not sched:
+        return None  # unknown society: never cached
+    if not sched['start_time'] or not sched['end_time']:
+        window = None
+    else:
+        window = (sched['start_time'], sched['end_time'])
+    with _SCHED_CACHE_LOCK:
+        SCHED_CACHE[society] = (window, now + SCHEDULE_CACHE_TTL)
+        SCHED_CACHE.move_to_end(society)
+        while len(SCHED_CACHE) > SCHEDULE_CACHE_MAX:
+            SCHED_CACHE.popitem(last=False)
+    return window
+
 # --- Helper Function to Determine Household Query Clause ---
 def get_household_where_clause(data):
     """
@@ -131,6 +289,27 @@ def get_household_where_clause(data):
 
     return (where_clauses, params)
 
+# --- Pre-rendered pages ---
+# The landing and login pages only depend on the (static) language table, so
+# each variant is rendered once per process and then served as bytes with an
+# ETag; browsers revalidate every visit and usually get a 304.
+_STATIC_PAGES = {}  # cache key -> (rendered HTML bytes, etag)
+
+def static_page_response(key, template, **context):
+    page = _STATIC_PAGES.get(key)
+    if page is None or app.debug:
+        html = render_template(template, **context).encode('utf-8')
+        page = (html, hashlib.sha1(html).hexdigest())
+        _STATIC_PAGES[key] = page
+    html, etag = page
+    resp = make_response(html)
+    resp.mimetype = 'text/html'
+    resp.headers['Cache-Control'] = 'no-cache, must-revalidate, max-age=0'
+    resp.headers['Pragma'] = 'no-cache'
+    resp.headers['Expires'] = '0'
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
 # --- Select language ---
 @app.route("/", methods=["GET","POST"])
 def select_language():
@@ -140,11 +319,7 @@ def select_language():
         if lang_code in languages:
             session['lang']=lang_code
             return redirect(url_for('login'))
-    resp = make_response(render_template("select_language.html", languages=languages))
-    resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    resp.headers['Pragma'] = 'no-cache'
-    resp.headers['Expires'] = '0'
-    return resp
+    return static_page_response('select_language', "select_language.html", languages=languages)
 
 # --- Login page ---
 @app.route("/login", methods=["GET","POST"])
@@ -160,17 +335,14 @@ def login():
         return redirect(url_for('login'))
 
     # If we reach here, lang is the correctly selected language code.
-    resp = make_response(render_template(
+    return static_page_response(
+        ('login', lang),
         "vote.html", 
         societies=[], 
         community_data={}, 
         languages=languages, 
         selected_language_code=lang
-    ))
-    resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    resp.headers['Pragma'] = 'no-cache'
-    resp.headers['Expires'] = '0'
-    return resp
+    )
 
 # --- API: Get society details ---
 @app.route("/api/get_society_details", methods=["POST"])
@@ -187,7 +359,7 @@ def get_society_details():
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
             # Fetch housing type
-            cur.execute("SELECT housing_type FROM settings WHERE society_name=%s", (society_name,))
+            execute_prepared(cur, "society_housing_type", (society_name,))
             setting = cur.fetchone()
             if not setting or not setting['housing_type']:
                 return jsonify({"success": False, "message": "Society not found."}), 404
@@ -196,28 +368,34 @@ def get_society_details():
 
             # Apartments
             if 'apartment' in housing_type:
-                cur.execute("""
-                    SELECT tower, flat FROM households
-                    WHERE society_name=%s
-                    ORDER BY tower, flat
+                # Build the tower -> floor -> [flats] document server-side. Floor is the
+                # flat's digits minus the last two ('GF' for two digits or fewer) and
+                # flats are ordered numerically, matching numeric_sort.
+                cur.execute(r"""
+                    SELECT jsonb_object_agg(tower, floors) AS community_data
+                    FROM (
+                        SELECT tower, jsonb_object_agg(floor, flats) AS floors
+                        FROM (
+                            SELECT tower, f.floor, jsonb_agg(flat ORDER BY f.flat_num, flat) AS flats
+                            FROM (
+                                SELECT tower::text AS tower, flat::text AS flat,
+                                       regexp_replace(flat::text, '\D', '', 'g') AS digits
+                                FROM households
+                                WHERE society_name=%s AND tower IS NOT NULL AND flat IS NOT NULL
+                            ) h,
+                            LATERAL (
+                                SELECT CASE WHEN length(digits) > 2 THEN left(digits, -2) ELSE 'GF' END AS floor,
+                                       COALESCE(NULLIF(digits, '')::numeric, 0) AS flat_num
+                            ) f
+                            GROUP BY tower, f.floor
+                        ) per_floor
+                        GROUP BY tower
+                    ) per_tower
                 """, (society_name,))
-                rows = cur.fetchall()
-                if not rows:
+                community_structure = cur.fetchone()['community_data']
+                if not community_structure:
                     return jsonify({"success": False, "message": "No households found."}), 404
 
-                community_structure = {}
-                for r in rows:
-                    tower, flat = r['tower'], str(r['flat'])
-                    floor = 'GF'
-                    digits = ''.join(filter(str.isdigit, flat))
-                    if len(digits) > 2:
-                        floor = digits[:-2]
-                    community_structure.setdefault(tower, {}).setdefault(floor, []).append(flat)
-
-                # Sort floors/flats
-                for t in community_structure:
-                    community_structure[t] = {k: numeric_sort(v) for k, v in community_structure[t].items()}
-
                 return jsonify({
                     "success": True,
                     "community_type": "apartment",
@@ -226,21 +404,22 @@ def get_society_details():
 
             # Individual with lanes — use tower as lane name, flat as house number
             elif 'lanes' in housing_type:
-                cur.execute("""
+                # Houses come back in numeric_sort order within each lane, so one groupby pass builds the map.
+                cur.execute(r"""
                     SELECT tower AS lane, flat AS house_number FROM households
                     WHERE society_name=%s
-                    ORDER BY lane, house_number
+                    ORDER BY lane,
+                             COALESCE(NULLIF(regexp_replace(flat::text, '\D', '', 'g'), '')::numeric, 0),
+                             house_number
                 """, (society_name,))
                 rows = cur.fetchall()
                 if not rows:
                     return jsonify({"success": False, "message": "No households found."}), 404
 
-                lane_structure = {}
-                for r in rows:
-                    lane, house = r['lane'], str(r['house_number'])
-                    lane_structure.setdefault(lane, []).append(house)
-
-                lane_structure = {k: numeric_sort(v) for k, v in lane_structure.items()}
+                lane_structure = {
+                    lane: [str(r['house_number']) for r in houses]
+                    for lane, houses in groupby(rows, key=itemgetter('lane'))
+                }
 
                 return jsonify({
                     "success": True,
@@ -271,8 +450,7 @@ def get_society_details():
         return jsonify({"success": False, "message": "Server error fetching society details."}), 500
 
     finally:
-        if conn:
-            conn.close()
+        put_db(conn)
 
 # --- Verification: Secret Code (MODIFIED for Single-Use Mobile Code) ---
 @app.route("/api/verify_code", methods=["POST"])
@@ -300,9 +478,8 @@ def verify_code():
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
             
             # 1. Fetch Voting Schedule (needed for vote mode)
-            cur.execute("SELECT start_time, end_time FROM voting_schedule WHERE society_name=%s", (society,))
-            sched = cur.fetchone()
-            if not sched or not sched['start_time'] or not sched['end_time']:
+            sched = get_voting_schedule(cur, society)
+            if not sched:
                 return jsonify({"success": False, "message": "Voting schedule not set"}), 403
 
             # 2. Fetch Household Record using address components (NOT the code)
@@ -368,24 +545,9 @@ def verify_code():
 
             if mode == 'vote':
                 # Check voting window
-                try:
-                    start_time_raw = sched['start_time']
-                    end_time_raw = sched['end_time']
-                    
-                    if isinstance(start_time_raw, str): start_time_raw = start_time_raw.replace('Z', '+00:00')
-                    if isinstance(end_time_raw, str): end_time_raw = end_time_raw.replace('Z', '+00:00')
-                    
-                    start_time = start_time_raw if isinstance(start_time_raw, datetime) else datetime.fromisoformat(start_time_raw)
-                    end_time = end_time_raw if isinstance(end_time_raw, datetime) else datetime.fromisoformat(end_time_raw)
-
-                    if start_time.tzinfo is None: start_time = start_time.replace(tzinfo=pytz.utc)
-                    if end_time.tzinfo is None: end_time = end_time.replace(tzinfo=pytz.utc)
-
-                    if not (start_time <= datetime.now(pytz.utc) < end_time):
-                        return jsonify({"success": False, "message": "Voting is closed"}), 403
-                except Exception as e:
-                    app.logger.error(f"Date parsing error: {e}")
-                    return jsonify({"success": False, "message": "Invalid date format or timezone error"}), 400
+                start_time, end_time = sched
+                if not (start_time <= datetime.now(pytz.utc) < end_time):
+                    return jsonify({"success": False, "message": "Voting is closed"}), 403
 
                 # CRITICAL FIX: Explicitly handle the 'already voted' case before the final success block.
                 if h['voted_in_cycle'] == 1:
@@ -423,8 +585,7 @@ def verify_code():
         app.logger.error(f"Verify code error: {e}", exc_info=True)
         return jsonify({"success": False, "message": "Server error: " + str(e)}), 500
     finally:
-        if conn:
-            conn.close()
+        put_db(conn)
             
 # --- New API: Reset Code (MODIFIED) ---
 @app.route('/api/reset_code', methods=['POST'])
@@ -495,8 +656,211 @@ def reset_code():
         app.logger.error(f"Reset code error: {e}", exc_info=True)
         return jsonify({"success": False, "message": "Server error during reset."}), 500
     finally:
-        if conn:
-            conn.close()
+        put_db(conn)
+
+# --- Face helpers ---
+# DeepFace is an optional dependency: it is only imported once face
+# verification actually needs the model, so the app still starts without it.
+FACENET_COSINE_THRESHOLD = 0.40  # DeepFace's default for Facenet + cosine
+_FACENET = None
+_FACENET_LOCK = threading.Lock()
+
+def configure_tf_device():
+    """
+    Pins TensorFlow to the GPU named by FACE_CUDA_DEVICE (e.g. "0"), if set.
+    Must run before TensorFlow is first imported. Memory growth is enabled so
+    several worker processes can share one card.
+    """
+    device = os.getenv("FACE_CUDA_DEVICE")
+    if device is not None:
+        if 'tensorflow' in sys.modules:
+            app.logger.warning("FACE_CUDA_DEVICE ignored: TensorFlow was imported before configure_tf_device()")
+        os.environ["CUDA_VISIBLE_DEVICES"] = device
+    import tensorflow as tf
+    for gpu in tf.config.list_physical_devices('GPU'):
+        tf.config.experimental.set_memory_growth(gpu, True)
+
+def get_facenet():
+    """Builds the Facenet model once per process; DeepFace reuses it on later calls."""
+    global _FACENET
+    if _FACENET is None:
+        with _FACENET_LOCK:
+            if _FACENET is None:
+                configure_tf_device()
+                from deepface import DeepFace
+                _FACENET = DeepFace.build_model('Facenet')
+    return _FACENET
+
+# Concurrent verify_face requests hand their aligned face crop to a single
+# worker thread, which stacks whatever arrived within FACE_BATCH_WAIT seconds
+# (up to FACE_BATCH_MAX faces) into one Facenet forward pass.
+FACENET_INPUT_SIZE = (160, 160)
+FACE_BATCH_MAX = int(os.getenv("FACE_BATCH_MAX", 16))
+FACE_BATCH_WAIT = float(os.getenv("FACE_BATCH_WAIT", 0.01))
+FACE_EMBED_TIMEOUT = float(os.getenv("FACE_EMBED_TIMEOUT", 30))
+_FACE_QUEUE = queue.Queue()
+_FACE_WORKER = None
+
+def _face_worker_loop(model):
+    while True:
+        batch = [_FACE_QUEUE.get()]
+        deadline = time.monotonic() + FACE_BATCH_WAIT
+        while len(batch) < FACE_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_FACE_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            embeddings = model.predict(np.stack([face for face, _ in batch]), batch_size=len(batch), verbose=0)
+            for (_, fut), emb in zip(batch, embeddings):
+                fut.set_result(np.asarray(emb, dtype=np.float32))
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+
+def _start_face_worker():
+    """
+    Loads Facenet and starts the batching thread once per process. Never call
+    this before a fork: TensorFlow's thread pools and CUDA contexts do not
+    survive it. All forward passes go through the one batching thread, so the
+    model needs no extra lock.
+    """
+    global _FACE_WORKER
+    if _FACE_WORKER is None:
+        model = get_facenet()  # load here so a missing model fails the request, not the thread
+        model = getattr(model, 'model', model)  # DeepFace client wraps the Keras model
+        with _FACENET_LOCK:
+            if _FACE_WORKER is None:
+                _FACE_WORKER = threading.Thread(target=_face_worker_loop, args=(model,), name="facenet-batcher", daemon=True)
+                _FACE_WORKER.start()
+
+FACE_DECODE_MAX_SIDE = 640  # plenty for the face detector; selfies are often 3-4x larger
+
+def decode_image(image_data):
+    """
+    Decodes a (data-URL or bare) base64 image into an RGB uint8 array no larger
+    than FACE_DECODE_MAX_SIDE. JPEGs are downscaled by libjpeg(-turbo) while
+    decoding; PyTurboJPEG is used when available, PIL otherwise.
+    """
+    _, encoded = image_data.split(",", 1) if "," in image_data else (None, image_data)
+    raw = b64.b64decode(encoded)
+    img = None
+    if TJ is not None:
+        try:
+            width, height, _, _ = TJ.decode_header(raw)
+            scale = next((n for n in (8, 4, 2) if max(width, height) // n >= FACE_DECODE_MAX_SIDE), 1)
+            img = Image.fromarray(TJ.decode(raw, pixel_format=TJPF_RGB, scaling_factor=(1, scale)))
+        except (OSError, ValueError):
+            img = None  # not a JPEG (e.g. PNG upload): let PIL handle it
+    if img is None:
+        img = Image.open(io.BytesIO(raw))
+        img.draft('RGB', (FACE_DECODE_MAX_SIDE, FACE_DECODE_MAX_SIDE))
+        img = img.convert('RGB')
+    img.thumbnail((FACE_DECODE_MAX_SIDE, FACE_DECODE_MAX_SIDE), Image.BILINEAR)
+    return np.asarray(img)
+
+def detect_face(img_np):
+    """
+    Returns the aligned face in an image array as a 160x160x3 Facenet input
+    (ValueError if none). Mirrors DeepFace.represent's preprocessing so the
+    result matches embeddings stored by the admin app.
+    """
+    from deepface import DeepFace
+    from deepface.modules import preprocessing
+    face = DeepFace.extract_faces(img_path=img_np, enforce_detection=True, align=True)[0]['face']
+    face = face[:, :, ::-1]  # extract_faces returns RGB; represent feeds the model BGR
+    face = preprocessing.resize_image(img=face, target_size=FACENET_INPUT_SIZE)
+    return preprocessing.normalize_input(img=face, normalization='base')[0]
+
+def face_embedding(img_np):
+    """
+    Returns the Facenet embedding of the face in an image array (ValueError if none).
+    check_face_pipeline.py verifies it matches DeepFace.represent.
+    """
+    _start_face_worker()  # first: configures the TF device before deepface imports TensorFlow
+    face = detect_face(img_np)
+    fut = Future()
+    _FACE_QUEUE.put((face, fut))
+    return fut.result(timeout=FACE_EMBED_TIMEOUT)
+
+# Stored embeddings are L2-normalised float32 in network byte order (what
+# PostgreSQL's float4send produces, see migrations/003), so cosine similarity
+# is a plain dot product.
+EMBEDDING_DTYPE = np.dtype('>f4')
+FACENET_EMBEDDING_DIM = 128
+EMBEDDING_NBYTES = FACENET_EMBEDDING_DIM * EMBEDDING_DTYPE.itemsize
+
+def normalize_embedding(emb):
+    emb = np.asarray(emb, dtype=np.float32)
+    return emb / np.linalg.norm(emb)
+
+def unpack_embedding(buf):
+    """Returns the stored embedding as float32, or None if buf is not a 512-byte blob (e.g. old JSON text)."""
+    if not isinstance(buf, (bytes, bytearray, memoryview)) or len(buf) != EMBEDDING_NBYTES:
+        return None
+    return np.frombuffer(buf, dtype=EMBEDDING_DTYPE).astype(np.float32)
+
+def is_face_match(live_emb, stored_emb):
+    """Both embeddings must already be L2-normalised."""
+    return 1.0 - float(live_emb @ stored_emb) <= FACENET_COSINE_THRESHOLD
+
+# --- Tower/lane face index ---
+# For 1:N identification within one tower (or lane) each process keeps its
+# enrolled embeddings as one (N, 128) float32 matrix, so matching is a single GEMV.
+# Identification is never society-wide: the voter must still name their tower or
+# lane, and a stricter threshold than the 1:1 check applies because false
+# matches grow with N.
+# Enrolment happens in the admin app, hence the TTL rather than write hooks.
+# The matrix deliberately stays float32: an index is at most a few hundred KB
+# and the GEMV takes microseconds next to the Facenet forward pass, while
+# NumPy has no int8 BLAS path (int8 @ int8 would be slower, not faster).
+FACENET_IDENTIFY_THRESHOLD = float(os.getenv("FACENET_IDENTIFY_THRESHOLD", 0.30))
+FACE_INDEX_TTL = float(os.getenv("FACE_INDEX_TTL", 300))
+FACE_INDEX_MAX = int(os.getenv("FACE_INDEX_MAX", 256))
+_FACE_INDEX = OrderedDict()  # (society_name, tower) -> (ids, embeddings, expires_at)
+_FACE_INDEX_LOCK = threading.Lock()
+
+def get_face_index(cur, society, tower):
+    """Returns (household_ids, embeddings) for every enrolled face in one tower/lane of a society."""
+    key = (society, tower)
+    now = time.monotonic()
+    with _FACE_INDEX_LOCK:
+        cached = _FACE_INDEX.get(key)
+        if cached and cached[2] > now:
+            _FACE_INDEX.move_to_end(key)
+            return cached[0], cached[1]
+
+    cur.execute("SELECT id, face_recognition_image FROM households WHERE society_name=%s AND tower=%s AND face_recognition_image IS NOT NULL ORDER BY id", (society, tower))
+    ids, rows = [], []
+    for r in cur.fetchall():
+        emb = unpack_embedding(r['face_recognition_image'])
+        if emb is None:
+            app.logger.error(f"Skipping household {r['id']}: stored face embedding is not a {EMBEDDING_NBYTES}-byte blob")
+            continue
+        ids.append(r['id']); rows.append(emb)
+    ids = np.array(ids, dtype=np.int64)
+    embeddings = np.stack(rows) if rows else np.empty((0, FACENET_EMBEDDING_DIM), dtype=np.float32)
+    if len(ids):  # empty results come from arbitrary request input; don't cache them
+        with _FACE_INDEX_LOCK:
+            _FACE_INDEX[key] = (ids, embeddings, now + FACE_INDEX_TTL)
+            _FACE_INDEX.move_to_end(key)
+            while len(_FACE_INDEX) > FACE_INDEX_MAX:
+                _FACE_INDEX.popitem(last=False)
+    return ids, embeddings
+
+def identify_face(cur, society, tower, live_emb):
+    """Returns the id of the household in the tower/lane whose face best matches live_emb, or None."""
+    ids, embeddings = get_face_index(cur, society, tower)
+    if not len(ids):
+        return None
+    scores = embeddings @ live_emb
+    best = int(scores.argmax())
+    if 1.0 - float(scores[best]) > FACENET_IDENTIFY_THRESHOLD:
+        return None
+    return int(ids[best])
 
 # --- Verification: Face ---
 @app.route("/api/verify_face", methods=["POST"])
@@ -510,33 +874,44 @@ def verify_face():
 #   try:
 #       with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
 #           # Voting schedule check
-#           cur.execute("SELECT start_time,end_time FROM voting_schedule WHERE society_name=%s",(society,))
-#           sched=cur.fetchone()
-#           start_time=datetime.fromisoformat(sched['start_time'].replace('Z','+00:00'))
-#           end_time=datetime.fromisoformat(sched['end_time'].replace('Z','+00:00'))
+#           sched=get_voting_schedule(cur,society)
+#           if not sched: return jsonify({"verified":False,"message":"Voting schedule not set"}),403
+#           start_time,end_time=sched
 #           if not (start_time<=datetime.now(pytz.utc)<end_time): return jsonify({"verified":False,"message":"Voting is closed"})
 #
-#           query="SELECT * FROM households WHERE society_name=%s AND face_recognition_image IS NOT NULL"
+#           live_emb=None
+#           query="SELECT id,voted_in_cycle,voted_at,is_admin_blocked,is_vote_allowed{face_col} FROM households WHERE society_name=%s AND face_recognition_image IS NOT NULL"
 #           params=[society]
 #           if tower and flat: query+=" AND tower=%s AND flat=%s"; params.extend([tower,flat])
 #           elif lane and house: query+=" AND tower=%s AND flat=%s"; params.extend([lane,house])
 #           elif flat: query+=" AND flat=%s"; params.extend([flat])
 #           elif not (tower or flat or lane or house): query+=" AND tower IS NULL AND flat IS NULL AND lane IS NULL AND house_number IS NULL"
+#           elif tower or lane:
+#               # Tower/lane without a flat/house: identify the household among that tower's/lane's enrolled faces
+#               live_emb=normalize_embedding(face_embedding(decode_image(image_data)))
+#               household_id=identify_face(cur,society,tower or lane,live_emb)
+#               if household_id is None: return jsonify({"verified":False,"message":"Face not recognized"})
+#               query+=" AND id=%s"; params.append(household_id)
 #           else: return jsonify({"verified":False,"message":"Incomplete household details"}),400
 #
-#           cur.execute(query,tuple(params))
+#           # The stored embedding is only needed when identification has not already matched it
+#           cur.execute(query.format(face_col="" if live_emb is not None else ",face_recognition_image"),tuple(params))
 #           row=cur.fetchone()
 #           if not row: return jsonify({"verified":False,"message":"No face record found"})
 #           if row['voted_in_cycle']==1: return jsonify({"verified":False,"message":"Already voted"})
 #           if row['is_admin_blocked']: return jsonify({"verified":False,"message":"Blocked"})
 #           if not row['is_vote_allowed']: return jsonify({"verified":False,"message":"Voting not allowed"})
 #
-#           # Decode live image
-#           _,encoded=image_data.split(",",1) if "," in image_data else (None,image_data)
-#           live_np=np.array(Image.open(io.BytesIO(base64.b64decode(encoded))).convert('RGB'))
-#           live_emb=DeepFace.represent(img_path=live_np,model_name='Facenet',enforce_detection=True)[0]['embedding']
-#           stored_emb=json.loads(row['face_recognition_image'])
-#           verified=DeepFace.verify(img1_path=live_emb,img2_path=stored_emb,model_name='Facenet',distance_metric='cosine')['verified']
+#           # Decode live image and compare (identification has already matched otherwise)
+#           if live_emb is None:
+#               stored_emb=unpack_embedding(row['face_recognition_image'])
+#               if stored_emb is None:
+#                   app.logger.error(f"Household {row['id']}: stored face embedding is not a {EMBEDDING_NBYTES}-byte blob")
+#                   return jsonify({"verified":False,"message":"No face record found"})
+#               live_emb=normalize_embedding(face_embedding(decode_image(image_data)))
+#               verified=is_face_match(live_emb,stored_emb)
+#           else:
+#               verified=True
 #
 #           if verified:
 #               session['household_id']=row['id']
@@ -555,7 +930,7 @@ def verify_face():
 #           app.logger.error(f"Face verification error: {e}",exc_info=True)
 #           return jsonify({"verified":False,"message":"Server error"}),500
 #   finally:
-#       if conn: conn.close()
+#       put_db(conn)
     return jsonify({"verified": False, "message": "Face verification temporarily disabled"}), 200
 
 # --- Ballot page ---
@@ -573,19 +948,20 @@ def ballot():
             if h['voted_in_cycle']==1: session.clear(); flash("Already voted","info"); return redirect(url_for("select_language"))
             society=h['society_name']; tower=h['tower']
 
-            cur.execute("SELECT max_candidates_selection,is_towerwise FROM settings WHERE society_name=%s",(society,))
+            execute_prepared(cur,"ballot_settings",(society,))
             s=cur.fetchone(); max_sel=s['max_candidates_selection'] if s else 1; is_towerwise=s['is_towerwise'] if s else False
 
             if is_towerwise and tower:
-                cur.execute("SELECT contestant_name,contestant_symbol,contestant_photo_b64 FROM households WHERE is_contestant=1 AND society_name=%s AND tower=%s ORDER BY contestant_name",(society,tower))
+                cur.execute("SELECT id,contestant_name,contestant_symbol,NULLIF(contestant_photo_b64,'') IS NOT NULL AS has_photo FROM households WHERE is_contestant=1 AND society_name=%s AND tower=%s ORDER BY contestant_name",(society,tower))
             else:
-                cur.execute("SELECT contestant_name,contestant_symbol,contestant_photo_b64 FROM households WHERE is_contestant=1 AND society_name=%s ORDER BY contestant_name",(society,))
+                cur.execute("SELECT id,contestant_name,contestant_symbol,NULLIF(contestant_photo_b64,'') IS NOT NULL AS has_photo FROM households WHERE is_contestant=1 AND society_name=%s ORDER BY contestant_name",(society,))
             contestants=cur.fetchall()
             if not contestants: flash("No contestants","error"); return redirect(url_for("login"))
-            contestants_data=[{"name": c["contestant_name"],"symbol_b64": c["contestant_symbol"], "photo_b64": c["contestant_photo_b64"]
+            contestants_data=[{"name": c["contestant_name"],"symbol_b64": c["contestant_symbol"],
+                "photo_url": url_for("contestant_photo",contestant_id=c["id"]) if c["has_photo"] else None
             } for c in contestants]
     finally:
-        conn.close()
+        put_db(conn)
     lang=session.get('lang','en')
     resp=make_response(render_template("ballot.html",contestants=contestants_data,maxSelections=max_sel,languages=languages,society_name=society,selected_language_code=lang,tower_name=tower))
     resp.headers['Cache-Control']='no-store, no-cache, must-revalidate, max-age=0'
@@ -593,6 +969,43 @@ def ballot():
     resp.headers['Expires']='0'
     return resp
 
+# --- Contestant photo ---
+# Photos are served separately from the ballot page so the HTML stays small
+# and browsers can fetch and cache them in parallel.
+PHOTO_MIMETYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+@app.route("/contestant_photo/<int:contestant_id>")
+def contestant_photo(contestant_id):
+    society=session.get('society_name')
+    if "household_id" not in session or not society:
+        return "", 403
+    conn=get_db()
+    if not conn: return "", 500
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT contestant_photo_b64 FROM households WHERE id=%s AND is_contestant=1 AND society_name=%s AND NULLIF(contestant_photo_b64,'') IS NOT NULL",(contestant_id,society))
+            row=cur.fetchone()
+    finally:
+        put_db(conn)
+    if not row: return "", 404
+
+    # Stored as a data URL ("data:image/png;base64,...") or bare base64
+    header,encoded=row[0].split(",",1) if "," in row[0] else ("",row[0])
+    mimetype=(header[5:].split(";",1)[0].strip().lower() or "image/jpeg") if header.startswith("data:") else "image/jpeg"
+    # Only raster types: served from our own origin, SVG/HTML would run script with the voter's cookie
+    if mimetype not in PHOTO_MIMETYPES: return "", 404
+    try:
+        photo=b64.b64decode(encoded)
+    except ValueError:
+        return "", 404
+    if not photo: return "", 404
+    resp=make_response(photo)
+    resp.mimetype=mimetype
+    resp.headers['Cache-Control']='private, max-age=3600'
+    resp.headers['X-Content-Type-Options']='nosniff'
+    resp.add_etag()
+    return resp.make_conditional(request)
+
 # --- Submit vote ---
 @app.route("/submit_vote",methods=["POST"])
 def submit_vote():
@@ -600,29 +1013,25 @@ def submit_vote():
     household_id=session['household_id']; society=session.get('society_name')
     if not society: return jsonify({"success":False,"message":"Missing society info"}),400
     data=request.get_json(); selected=data.get("contestants")
-    if not selected: return jsonify({"success":False,"message":"No contestants selected"}),400
+    if not selected or not isinstance(selected,list): return jsonify({"success":False,"message":"No contestants selected"}),400
 
     conn=get_db()
     if not conn: return jsonify({"success":False,"message":"DB error"}),500
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute("SELECT tower,voted_in_cycle FROM households WHERE id=%s",(household_id,))
-            h=cur.fetchone(); VOTED_FLAG=1
-            if h['voted_in_cycle']==VOTED_FLAG: return jsonify({"success":False,"message":"Already voted"}),403
-            tower=h['tower'] if h else None
-            cur.execute("SELECT max_voters,voted_count FROM settings WHERE society_name=%s",(society,))
-            s=cur.fetchone()
-            if not s: return jsonify({"success":False,"message":"Settings not found"}),500
-            if s['voted_count']>=s['max_voters']: return jsonify({"success":False,"message":"Max votes reached"}),403
-
-            for c in selected:
-                cur.execute("""INSERT INTO votes (society_name,tower,contestant_name,is_archived,vote_count)
-                            VALUES (%s,%s,%s,%s,1)
-                            ON CONFLICT (society_name,tower,contestant_name,is_archived)
-                            DO UPDATE SET vote_count=votes.vote_count+1""",(society,tower,c,0))
-            cur.execute("UPDATE settings SET voted_count=voted_count+1 WHERE society_name=%s",(society,))
+            VOTED_FLAG=1
+            # Claim the household's vote atomically: a concurrent second submit matches no row.
             voted_timestamp = datetime.now(pytz.utc)
-            cur.execute("UPDATE households SET voted_in_cycle=%s, voted_at=%s WHERE id=%s",(VOTED_FLAG, voted_timestamp, household_id))
+            execute_prepared(cur,"claim_vote",(VOTED_FLAG,voted_timestamp,household_id))
+            h=cur.fetchone()
+            if not h: conn.rollback(); return jsonify({"success":False,"message":"Already voted"}),403
+            tower=h['tower']
+
+            # Bump the society counter only while under max_voters, and tally the selection in the same statement.
+            execute_prepared(cur,"tally_vote",(society,tower,selected))
+            t=cur.fetchone()
+            if not t['has_settings']: conn.rollback(); return jsonify({"success":False,"message":"Settings not found"}),500
+            if t['voted_count'] is None: conn.rollback(); return jsonify({"success":False,"message":"Max votes reached"}),403
         conn.commit(); session.pop('household_id',None); session.pop('society_name',None)
         msg=languages.get(session.get('lang','en'),{}).get('voteSuccess','Vote successfully cast!')
         return jsonify({"success":True,"message":msg})
@@ -631,10 +1040,10 @@ def submit_vote():
         app.logger.error(f"Submit vote error: {e}",exc_info=True)
         return jsonify({"success":False,"message":"Server error"}),500
     finally:
-        if conn: conn.close()
+        put_db(conn)
 
 if __name__ == '__main__':
-    # You would typically run this via a WSGI server in production.
+    # Production runs under gunicorn: `gunicorn -c gunicorn.conf.py app_votingsys:app`.
     # For local testing, you can uncomment this:
     # app.run(debug=True)
     pass
\ No newline at end of file
@@ -0,0 +1,26 @@
+# Checks that the batched Facenet path in app_votingsys (face_embedding) gives
+# the same embedding as DeepFace.represent, which the admin app used to enrol
+# the stored faces. Run it after installing or upgrading DeepFace:
+#   python check_face_pipeline.py selfie.jpg [more.jpg ...]
+import sys
+import numpy as np
+from PIL import Image
+from app_votingsys import face_embedding
+
+def main(paths):
+    ok = True
+    for path in paths:
+        img_np = np.asarray(Image.open(path).convert('RGB'))
+        batched = face_embedding(img_np)
+        from deepface import DeepFace  # after face_embedding, which sets the TF device first
+        reference = np.asarray(DeepFace.represent(img_path=img_np, model_name='Facenet', enforce_detection=True)[0]['embedding'], dtype=np.float32)
+        same = reference.shape == batched.shape and np.allclose(reference, batched, rtol=1e-3, atol=1e-4)
+        diff = float(np.abs(reference - batched).max()) if reference.shape == batched.shape else float('nan')
+        print(f"{'OK  ' if same else 'FAIL'} {path} (max abs diff {diff:.2e})")
+        ok = ok and same
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("usage: python check_face_pipeline.py IMAGE [IMAGE ...]")
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,25 @@
+# gunicorn settings for app_votingsys: gunicorn -c gunicorn.conf.py app_votingsys:app
+import multiprocessing, os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5001")
+# Pre-forked workers so a slow face verification never blocks other voters;
+# threads cover the short, IO-bound DB routes.
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+# Each worker's DB pool keeps DB_POOL_MIN idle connections (default:
+# GUNICORN_THREADS); keep it at least as high as threads, or returned
+# connections are closed and reopened on every burst.
+threads = int(os.getenv("GUNICORN_THREADS", 2))
+# Import the app once in the master. Importing app_votingsys never touches
+# TensorFlow or the database; DB pools and the Facenet model are created per worker.
+preload_app = True
+# Face verification can take several seconds on CPU.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+
+
+def post_worker_init(worker):
+    # With FACE_PRELOAD_MODEL=1 each worker builds Facenet (and starts its
+    # batching thread) at boot, after the fork, instead of on its first
+    # face verification.
+    if os.getenv("FACE_PRELOAD_MODEL") == "1":
+        from app_votingsys import _start_face_worker
+        _start_face_worker()
@@ -0,0 +1,3 @@
+-- Covers the per-society tower/flat scan in get_society_details.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS households_society_tower_flat
+    ON households (society_name, tower, flat);
@@ -0,0 +1,10 @@
+-- verify_code / verify_face find a household by society plus address
+-- (tower+flat, lane+house_number or flat); the tower+flat case is already
+-- served by households_society_tower_flat (001).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS households_society_lane_house
+    ON households (society_name, lane, house_number);
+
+-- Face verification only considers households with an enrolled face.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS households_face_lookup
+    ON households (society_name, tower, flat)
+    WHERE face_recognition_image IS NOT NULL;
@@ -0,0 +1,27 @@
+-- Store face embeddings as L2-normalised float32 bytea (network byte order,
+-- as produced by float4send) instead of JSON text. Writers (the admin app)
+-- must use the same layout: L2-normalise the 128-D Facenet embedding, then
+-- store it as big-endian float32, i.e. in Python
+-- (emb / np.linalg.norm(emb)).astype('>f4').tobytes()  -- 512 bytes.
+BEGIN;
+
+ALTER TABLE households ADD COLUMN face_embedding_bin bytea;
+
+UPDATE households h
+SET face_embedding_bin = (
+    SELECT string_agg(float4send((e.x::float8 / n.norm)::real), ''::bytea ORDER BY e.ord)
+    FROM jsonb_array_elements_text(h.face_recognition_image::jsonb) WITH ORDINALITY AS e(x, ord),
+         (SELECT sqrt(sum(v::float8 ^ 2)) AS norm
+          FROM jsonb_array_elements_text(h.face_recognition_image::jsonb) AS v) n
+)
+WHERE h.face_recognition_image IS NOT NULL;
+
+-- Dropping the old column also drops households_face_lookup (002).
+ALTER TABLE households DROP COLUMN face_recognition_image;
+ALTER TABLE households RENAME COLUMN face_embedding_bin TO face_recognition_image;
+
+CREATE INDEX households_face_lookup
+    ON households (society_name, tower, flat)
+    WHERE face_recognition_image IS NOT NULL;
+
+COMMIT;
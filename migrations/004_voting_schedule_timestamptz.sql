@@ -0,0 +1,19 @@
+-- Restart the voting app after applying: pooled connections hold a prepared
+-- voting_schedule statement whose result type this migration changes.
+-- voting_schedule times were stored as ISO strings (optionally with 'Z' or an
+-- offset); naive values have always been treated as UTC by the app.
+BEGIN;
+
+ALTER TABLE voting_schedule
+    ALTER COLUMN start_time TYPE timestamptz USING (
+        CASE WHEN NULLIF(start_time::text, '') IS NULL THEN NULL
+             WHEN start_time::text ~ '\d:\d\d(:\d\d(\.\d+)?)?\s*(Z|[+-]\d\d(:?\d\d)?)$' THEN start_time::text::timestamptz
+             ELSE start_time::text::timestamp AT TIME ZONE 'UTC'
+        END),
+    ALTER COLUMN end_time TYPE timestamptz USING (
+        CASE WHEN NULLIF(end_time::text, '') IS NULL THEN NULL
+             WHEN end_time::text ~ '\d:\d\d(:\d\d(\.\d+)?)?\s*(Z|[+-]\d\d(:?\d\d)?)$' THEN end_time::text::timestamptz
+             ELSE end_time::text::timestamp AT TIME ZONE 'UTC'
+        END);
+
+COMMIT;